@@ -0,0 +1,70 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import auth_generation_name, get_generation
+
+AUTH_TOKEN_KEY = 'auth_token:{key}'
+
+_tokens_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _get_cached(key):
+    with _lock:
+        entry = _tokens_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _tokens_cache[key]
+            return None
+        _tokens_cache.move_to_end(key)
+        return entry[1:]
+
+
+def _set_cached(key, user, generation):
+    with _lock:
+        _tokens_cache[key] = (
+            time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL,
+            user, generation)
+        _tokens_cache.move_to_end(key)
+        while len(_tokens_cache) > settings.AUTH_TOKEN_CACHE_SIZE:
+            _tokens_cache.popitem(last=False)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе на каждый вызов API.
+
+    Пользователь по токену хранится в LRU процесса с TTL, а при
+    AUTH_TOKEN_SHARED_CACHE ещё и в общем кеше Django. Вместе с ним
+    запоминается поколение auth:<id пользователя>; сигналы меняют его
+    при выходе, смене пароля, деактивации и любой другой правке
+    пользователя, и старые записи перестают совпадать.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = _get_cached(key)
+        if cached is None and settings.AUTH_TOKEN_SHARED_CACHE:
+            cached = cache.get(AUTH_TOKEN_KEY.format(key=key))
+            if cached is not None:
+                _set_cached(key, *cached)
+        if cached is not None:
+            user, generation = cached
+            if get_generation(auth_generation_name(user.id)) == generation:
+                # Копия: представления могут менять атрибуты пользователя
+                user = copy.copy(user)
+                return user, self.get_model()(key=key, user=user)
+        user, token = super().authenticate_credentials(key)
+        # Правка пользователя между запросом и чтением поколения может
+        # оставить старый снимок, но не дольше AUTH_TOKEN_CACHE_TTL
+        generation = get_generation(auth_generation_name(user.id))
+        _set_cached(key, user, generation)
+        if settings.AUTH_TOKEN_SHARED_CACHE:
+            cache.set(AUTH_TOKEN_KEY.format(key=key), (user, generation),
+                      settings.AUTH_TOKEN_CACHE_TTL)
+        return copy.copy(user), token
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .cache import INGREDIENTS, get_generation
+from .ingredient_index import ingredient_index
+from foodgram.recipe.models import Ingredient
+
+_matches_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _rank(rows, query):
+    """Сначала совпадения с начала названия, затем вхождения подстроки."""
+    ranked = []
+    for row in rows:
+        name = row['name'].lower()
+        position = name.find(query)
+        if position != -1:
+            ranked.append((position != 0, name, row))
+    ranked.sort(key=lambda item: item[:2])
+    return [row for _, _, row in ranked]
+
+
+def _get_cached(key):
+    with _lock:
+        matches = _matches_cache.get(key)
+        if matches is not None:
+            _matches_cache.move_to_end(key)
+        return matches
+
+
+def _set_cached(key, matches):
+    with _lock:
+        _matches_cache[key] = matches
+        _matches_cache.move_to_end(key)
+        cache_size = settings.INGREDIENTS_AUTOCOMPLETE_CACHE_SIZE
+        while len(_matches_cache) > cache_size:
+            _matches_cache.popitem(last=False)
+
+
+def get_matches(query):
+    """Все ингредиенты, в названии которых есть query, по рангу.
+
+    Всё, что содержит query, содержит и любой его префикс, поэтому
+    результат для более короткого запроса из кеша фильтруется в памяти.
+    Если в кеше нет ни одного префикса, ищем в индексе в памяти,
+    а когда он выключен — в базе.
+    """
+    if settings.INGREDIENTS_INDEX_ENABLED:
+        ingredient_index.ensure_fresh()
+    generation = get_generation(INGREDIENTS)
+    matches = _get_cached((generation, query))
+    if matches is not None:
+        return matches
+    for end in range(len(query) - 1, -1, -1):
+        candidates = _get_cached((generation, query[:end]))
+        if candidates is not None:
+            break
+    else:
+        if settings.INGREDIENTS_INDEX_ENABLED:
+            matches = ingredient_index.search(query)
+            _set_cached((generation, query), matches)
+            return matches
+        candidates = Ingredient.objects.filter(
+            name__icontains=query
+        ).values('id', 'name', 'measurement_unit')
+    matches = _rank(candidates, query)
+    _set_cached((generation, query), matches)
+    return matches
+
+
+def autocomplete_ingredients(query, limit=None):
+    if limit is None:
+        limit = settings.INGREDIENTS_AUTOCOMPLETE_LIMIT
+    limit = max(0, min(limit, settings.INGREDIENTS_AUTOCOMPLETE_MAX_LIMIT))
+    return get_matches(query.strip().lower())[:limit]
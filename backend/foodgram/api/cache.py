@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from foodgram.recipe.models import DataVersion, Tag
+
+GENERATION_KEY = 'generation:{name}'
+RECIPES = 'recipes'
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RECIPE_FRAGMENTS = 'recipe_fragments'
+# Рейтинг популярных рецептов, меняет команда update_popularity
+POPULARITY = 'popularity'
+SHOPPING_CART_FILE_KEY = 'shopping_cart:{user_id}:{version}:{format}'
+
+
+def get_query_signature(query_params, exclude=()):
+    """Хеш параметров запроса, не зависящий от их порядка."""
+    params = sorted(
+        (key, value) for key, values in query_params.lists()
+        if key not in exclude for value in values)
+    return hashlib.md5(json.dumps(params).encode()).hexdigest()
+
+
+def get_generation(name):
+    """Поколение данных name, меняется при каждой их правке.
+
+    Начальное значение берётся из времени, чтобы после вытеснения ключа
+    из кеша не совпасть со старым поколением и не отдать устаревшие данные.
+    """
+    sync_data_versions()
+    key = GENERATION_KEY.format(name=name)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_generations(names):
+    """Поколения сразу для нескольких names одним обращением к кешу."""
+    sync_data_versions()
+    keys = {GENERATION_KEY.format(name=name): name for name in names}
+    generations = cache.get_many(keys)
+    for key in keys.keys() - generations.keys():
+        cache.add(key, time.time_ns(), timeout=None)
+        generations[key] = cache.get(key)
+    return {keys[key]: generation for key, generation in generations.items()}
+
+
+_data_versions = None
+_data_versions_checked_at = None
+_data_versions_lock = threading.Lock()
+
+
+def sync_data_versions():
+    """Сбрасывает поколения, чьи версии в DataVersion сменила команда.
+
+    База опрашивается не чаще раза в DATA_VERSION_CHECK_INTERVAL секунд,
+    при первом опросе версии только запоминаются.
+    """
+    global _data_versions, _data_versions_checked_at
+    now = time.monotonic()
+    with _data_versions_lock:
+        if (_data_versions_checked_at is not None
+                and now - _data_versions_checked_at
+                < settings.DATA_VERSION_CHECK_INTERVAL):
+            return
+        _data_versions_checked_at = now
+    versions = dict(DataVersion.objects.values_list('name', 'version'))
+    with _data_versions_lock:
+        changed = [] if _data_versions is None else [
+            name for name, version in versions.items()
+            if _data_versions.get(name) != version]
+        _data_versions = versions
+    bump_generation(*changed)
+
+
+def bump_data_version(*names):
+    """bump_generation для management-команд, доходит и до веб-процесса."""
+    bump_generation(*names)
+    for name in names:
+        DataVersion.objects.get_or_create(name=name)
+        DataVersion.objects.filter(name=name).update(
+            version=F('version') + 1)
+
+
+def recipe_generation_name(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def auth_generation_name(user_id):
+    """Токены пользователя в кеше аутентификации."""
+    return f'auth:{user_id}'
+
+
+def viewer_generation_name(user_id):
+    """Избранное, корзина и подписки пользователя."""
+    return f'viewer:{user_id}'
+
+
+def bump_generation(*names):
+    for name in names:
+        key = GENERATION_KEY.format(name=name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_shopping_cart_version(user_id):
+    return get_generation(f'shopping_cart:{user_id}')
+
+
+def bump_shopping_cart_version(*user_ids):
+    bump_generation(*(f'shopping_cart:{user_id}' for user_id in user_ids))
+
+
+def get_shopping_cart_file(user_id, file_format, render):
+    """Файл списка покупок из кеша или сгенерированный через render()."""
+    key = SHOPPING_CART_FILE_KEY.format(
+        user_id=user_id, version=get_shopping_cart_version(user_id),
+        format=file_format)
+    content = cache.get(key)
+    if content is None:
+        content = render()
+        cache.set(key, content, settings.SHOPPING_CART_CACHE_TIMEOUT)
+    return content
+
+
+TAG_IDS_BY_SLUG_KEY = 'tag_ids_by_slug'
+
+
+def get_tag_ids_by_slug():
+    """{slug: id} всех тегов; сбрасывается сигналами при правке тегов."""
+    tag_ids = cache.get(TAG_IDS_BY_SLUG_KEY)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(TAG_IDS_BY_SLUG_KEY, tag_ids, timeout=None)
+    return tag_ids
+
+
+def reset_tag_ids_by_slug():
+    cache.delete(TAG_IDS_BY_SLUG_KEY)
@@ -0,0 +1,132 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Max
+
+from .cache import RECIPES, get_generation
+from foodgram.recipe.models import IngredientAmount, Recipe
+
+# Рецепты, сохранённые незадолго до последнего обновления, перечитываются:
+# их транзакции могли закоммититься позже
+UPDATED_AT_OVERLAP = timedelta(minutes=1)
+
+
+class CookableIndex:
+    """Обратный индекс ингредиент -> рецепты в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта — массив id его ингредиентов. Когда сигналы
+    меняют поколение RECIPES, индекс перечитывает только рецепты с
+    updated_at не раньше прошлого обновления. Удалённые рецепты убирает
+    сигнал через discard(); пропущенные им (удалены в другом процессе)
+    отбрасывает представление, не найдя их в базе.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._recipes = {}
+        self._generation = None
+        self._updated_at = None
+
+    def __len__(self):
+        return len(self._recipes)
+
+    def _load(self, recipe_ids=None):
+        amounts = IngredientAmount.objects.order_by()
+        if recipe_ids is not None:
+            amounts = amounts.filter(recipe_id__in=recipe_ids)
+        ingredients = defaultdict(set)
+        for recipe_id, ingredient_id in amounts.values_list(
+                'recipe_id', 'ingredient_id').iterator():
+            ingredients[recipe_id].add(ingredient_id)
+        return ingredients
+
+    def _remove(self, recipe_id):
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            postings = self._postings[ingredient_id]
+            del postings[bisect_left(postings, recipe_id)]
+            if not postings:
+                del self._postings[ingredient_id]
+
+    def _add(self, recipe_id, ingredient_ids):
+        self._recipes[recipe_id] = array('q', sorted(ingredient_ids))
+        for ingredient_id in ingredient_ids:
+            insort(self._postings.setdefault(ingredient_id, array('q')),
+                   recipe_id)
+
+    def build(self):
+        updated_at = Recipe.objects.aggregate(
+            updated_at=Max('updated_at'))['updated_at']
+        ingredients = self._load()
+        postings = defaultdict(list)
+        for recipe_id, ingredient_ids in ingredients.items():
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id].append(recipe_id)
+        with self._lock:
+            self._postings = {
+                ingredient_id: array('q', sorted(recipe_ids))
+                for ingredient_id, recipe_ids in postings.items()}
+            self._recipes = {
+                recipe_id: array('q', sorted(ingredient_ids))
+                for recipe_id, ingredient_ids in ingredients.items()}
+            self._updated_at = updated_at
+
+    def refresh(self):
+        """Перечитывает изменённые рецепты."""
+        changed = Recipe.objects.order_by()
+        if self._updated_at is not None:
+            changed = changed.filter(
+                updated_at__gte=self._updated_at - UPDATED_AT_OVERLAP)
+        changed = dict(changed.values_list('id', 'updated_at'))
+        ingredients = self._load(list(changed))
+        with self._lock:
+            for recipe_id in changed:
+                self._remove(recipe_id)
+                if ingredients[recipe_id]:
+                    self._add(recipe_id, ingredients[recipe_id])
+            latest = max(changed.values(), default=None)
+            if latest is not None and (self._updated_at is None
+                                       or latest > self._updated_at):
+                self._updated_at = latest
+
+    def discard(self, recipe_ids):
+        """Убирает удалённые рецепты."""
+        with self._lock:
+            for recipe_id in recipe_ids:
+                self._remove(recipe_id)
+
+    def ensure_fresh(self):
+        generation = get_generation(RECIPES)
+        if generation == self._generation:
+            return
+        if self._generation is None:
+            self.build()
+        else:
+            self.refresh()
+        self._generation = generation
+
+    def match(self, ingredient_ids, max_missing=None):
+        """Рецепты по покрытию ингредиентами: (id, не хватает, есть).
+
+        Сначала рецепты, для которых есть всё, затем по числу
+        недостающих ингредиентов, среди равных — новые.
+        """
+        have = defaultdict(int)
+        with self._lock:
+            for ingredient_id in set(ingredient_ids):
+                for recipe_id in self._postings.get(ingredient_id, ()):
+                    have[recipe_id] += 1
+            matches = [
+                (recipe_id, len(self._recipes[recipe_id]) - count, count)
+                for recipe_id, count in have.items()]
+        if max_missing is not None:
+            matches = [match for match in matches if match[1] <= max_missing]
+        matches.sort(key=lambda match: (match[1], -match[0]))
+        return matches
+
+
+cookable_index = CookableIndex()
@@ -0,0 +1,83 @@
+import base64
+import binascii
+import re
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import (TemporaryUploadedFile,
+                                            UploadedFile)
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+
+DATA_URI_RE = re.compile(r'^data:[\w/+.-]*;base64,')
+WHITESPACE_RE = re.compile(r'\s')
+# Кратно 4, чтобы каждый кусок декодировался отдельно
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """Изображение строкой base64 (data URI) или файлом multipart.
+
+    Длина строки проверяется до декодирования, декодируется она кусками
+    во временный файл. Формат и размеры берутся из заголовка, полное
+    декодирование пикселей не нужно.
+    """
+    default_error_messages = {
+        'too_large': 'Изображение больше {max_size} байт',
+        'invalid_base64': 'Неверная строка base64',
+        'invalid_image': 'Загрузите корректное изображение',
+        'invalid_format': 'Допустимые форматы: {formats}',
+        'too_many_pixels': 'Изображение больше {max_pixels} пикселей',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode(data)
+        elif not isinstance(data, UploadedFile):
+            self.fail('invalid_image')
+        elif data.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+        data.name = f'{uuid.uuid4()}.{self.check_header(data)}'
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        encoded = DATA_URI_RE.sub('', data, count=1)
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        # 4 символа base64 на 3 байта, плюс выравнивание
+        if len(encoded) > (max_size + 2) // 3 * 4 + 2:
+            self.fail('too_large', max_size=max_size)
+        if WHITESPACE_RE.search(encoded):
+            encoded = WHITESPACE_RE.sub('', encoded)
+        file = TemporaryUploadedFile('image', 'application/octet-stream',
+                                     0, None)
+        try:
+            for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    encoded[start:start + BASE64_CHUNK_SIZE], validate=True))
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        file.size = file.tell()
+        if file.size > max_size:
+            file.close()
+            self.fail('too_large', max_size=max_size)
+        file.seek(0)
+        return file
+
+    def check_header(self, file):
+        """Проверяет формат и размеры, возвращает расширение файла."""
+        try:
+            # Image.open читает только заголовок
+            with Image.open(file) as image:
+                image_format, (width, height) = image.format, image.size
+        except (UnidentifiedImageError, OSError):
+            self.fail('invalid_image')
+        finally:
+            file.seek(0)
+        formats = settings.RECIPE_IMAGE_FORMATS
+        if image_format not in formats:
+            self.fail('invalid_format', formats=', '.join(formats))
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail('too_many_pixels',
+                      max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        return formats[image_format]
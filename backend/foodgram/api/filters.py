@@ -1,14 +1,20 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from foodgram.recipe.models import Ingredient, Recipe, Tag
+from .cache import get_tag_ids_by_slug
+from foodgram.recipe.models import Ingredient, Recipe
+from foodgram.recipe.search import search_recipes
 from foodgram.user.models import User
 
 
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids_by_slug()]
+
+
 class RecipeFilter(filters.FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags',
     )
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(method='get_shopping_cart')
@@ -17,6 +23,21 @@ class RecipeFilter(filters.FilterSet):
         field_name='author__id',
         to_field_name='id',
     )
+    search = filters.CharFilter(method='get_search')
+
+    def get_tags(self, queryset, name, value):
+        # EXISTS вместо JOIN: рецепт с несколькими тегами не дублируется
+        tag_ids_by_slug = get_tag_ids_by_slug()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=[tag_ids_by_slug[slug] for slug in value])))
+
+    def get_search(self, queryset, name, value):
+        # Сортировка по релевантности заменяет сортировку по дате
+        value = value.strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value)
 
     def get_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -37,7 +58,8 @@ class RecipeFilter(filters.FilterSet):
         fields = ('tags',
                   'is_favorited',
                   'is_in_shopping_cart',
-                  'author')
+                  'author',
+                  'search')
 
 
 class IngredientFilter(filters.FilterSet):
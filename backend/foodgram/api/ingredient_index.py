@@ -0,0 +1,97 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .cache import INGREDIENTS, bump_generation, get_generation
+from foodgram.recipe.models import Ingredient
+
+# Больше любого символа, который встретится в названии
+PREFIX_END = '\U0010ffff'
+
+
+class IngredientIndex:
+    """Справочник ингредиентов в памяти процесса.
+
+    Хранится в отсортированных по названию (без учёта регистра) массивах,
+    поиск по префиксу идёт через bisect без запросов к базе. Индекс
+    перестраивается при смене поколения ингредиентов (сигналы) и при
+    расхождении числа строк или максимального id с базой, которое
+    проверяется не чаще раза в INGREDIENTS_INDEX_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._ids = array('q')
+        self._names = []
+        self._units = []
+        self._generation = None
+        self._db_state = None
+        self._checked_at = 0.0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _get_db_state(self):
+        state = Ingredient.objects.aggregate(count=Count('id'),
+                                             max_id=Max('id'))
+        return state['count'], state['max_id']
+
+    def build(self):
+        rows = sorted(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit'),
+            key=lambda row: (row[1].lower(), row[0]))
+        units = {}
+        with self._lock:
+            self._keys = [name.lower() for _, name, _ in rows]
+            self._ids = array('q', (ingredient_id for ingredient_id, _, _
+                                    in rows))
+            self._names = [name for _, name, _ in rows]
+            self._units = [units.setdefault(unit, sys.intern(unit))
+                           for _, _, unit in rows]
+            self._db_state = (len(rows), max(self._ids, default=None))
+            self._checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        generation = get_generation(INGREDIENTS)
+        if generation != self._generation:
+            self.build()
+            self._generation = generation
+            return
+        interval = settings.INGREDIENTS_INDEX_CHECK_INTERVAL
+        if time.monotonic() - self._checked_at < interval:
+            return
+        self._checked_at = time.monotonic()
+        if self._get_db_state() != self._db_state:
+            # Справочник меняли в обход сигналов
+            bump_generation(INGREDIENTS)
+            self._generation = get_generation(INGREDIENTS)
+            self.build()
+
+    def _row(self, position):
+        return {'id': self._ids[position], 'name': self._names[position],
+                'measurement_unit': self._units[position]}
+
+    def prefix(self, query):
+        """Ингредиенты, название которых начинается с query."""
+        query = query.lower()
+        start = bisect_left(self._keys, query)
+        end = bisect_left(self._keys, query + PREFIX_END, lo=start)
+        return [self._row(position) for position in range(start, end)]
+
+    def search(self, query):
+        """Все ингредиенты с query в названии, сначала совпавшие с начала."""
+        query = query.lower()
+        matches = self.prefix(query)
+        matches.extend(
+            self._row(position) for position, key in enumerate(self._keys)
+            if query in key and not key.startswith(query))
+        return matches
+
+
+ingredient_index = IngredientIndex()
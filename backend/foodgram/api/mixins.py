@@ -0,0 +1,95 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.http import condition
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import get_generations, get_query_signature, viewer_generation_name
+
+RESPONSE_CACHE_KEY = 'response:{generations}:{host}{path}:{params}'
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширует ответы list/retrieve для анонимных пользователей.
+
+    Ключ — хост, путь, отсортированные параметры запроса и поколения
+    из get_cache_generations(), которые сигналы меняют при любой правке данных.
+    """
+    cache_generations = ()
+
+    def get_cache_generations(self):
+        return self.cache_generations
+
+    def get_response_cache_key(self, request):
+        names = self.get_cache_generations()
+        generations = get_generations(names)
+        return RESPONSE_CACHE_KEY.format(
+            generations='-'.join(str(generations[name]) for name in names),
+            host=request.get_host(), path=request.path,
+            params=get_query_signature(request.query_params))
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request,
+                                        *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request,
+                                        *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """ETag и Last-Modified для list/retrieve, ответ 304 без сериализации.
+
+    ETag считается по счётчикам поколений из get_etag_generations(),
+    для ответов с флагами пользователя (viewer_dependent) — ещё и по
+    поколению его избранного, корзины и подписок.
+    """
+    etag_generations = ()
+    viewer_dependent = False
+
+    def get_etag_generations(self, request, **kwargs):
+        names = list(self.etag_generations)
+        if self.viewer_dependent and request.user.is_authenticated:
+            names.append(viewer_generation_name(request.user.id))
+        return names
+
+    def get_etag(self, request, *args, **kwargs):
+        names = self.get_etag_generations(request, **kwargs)
+        generations = get_generations(names)
+        user = request.user
+        validator = ':'.join((
+            str(user.id if user.is_authenticated else 'anon'),
+            request.get_host(), request.path,
+            get_query_signature(request.query_params),
+            *(f'{name}={generations[name]}' for name in names)))
+        return f'"{hashlib.md5(validator.encode()).hexdigest()}"'
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return None
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        view = condition(etag_func=self.get_etag,
+                         last_modified_func=self.get_last_modified)(handler)
+        return view(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(super().list, request,
+                                             *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(super().retrieve, request,
+                                             *args, **kwargs)
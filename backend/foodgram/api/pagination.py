@@ -0,0 +1,168 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import get_generations, get_query_signature
+
+
+class CursorLimitOffsetPagination(LimitOffsetPagination):
+    """limit/offset по умолчанию и keyset-пагинация по ?cursor=
+
+    Курсор — значения полей сортировки последней записи страницы.
+    Сортировка берётся из queryset и должна заканчиваться уникальным
+    полем (обычно id) с тем же направлением, например ('-pub_date', '-id').
+    Следующая страница выбирается условием по этим полям, без OFFSET и
+    без COUNT(*), поэтому глубокие страницы не замедляются.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+    count_cache_key = 'list_count:{path}:{viewer}:{signature}:{generations}'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.view = view
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.ordering = self.get_ordering(queryset)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            cursor_filter = self.get_cursor_filter(self.decode_cursor(cursor))
+            try:
+                # Значения неподходящего типа отвергает сам filter()
+                queryset = queryset.filter(cursor_filter)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        page = list(queryset.order_by(*self.ordering)[:self.limit + 1])
+        self.has_next = len(page) > self.limit
+        page = page[:self.limit]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_count_generations(self):
+        """Поколения данных списка из get_etag_generations() представления."""
+        get_etag_generations = getattr(self.view, 'get_etag_generations',
+                                       None)
+        if get_etag_generations is None:
+            return ()
+        return get_etag_generations(self.request, **self.view.kwargs)
+
+    def get_count_cache_key(self):
+        """Ключ счётчика: путь, зритель, параметры фильтрации и поколения.
+
+        Без поколений счётчик не кешируется: его нечем сбросить.
+        """
+        names = self.get_count_generations()
+        if not names:
+            return None
+        generations = get_generations(names)
+        signature = get_query_signature(
+            self.request.query_params,
+            exclude=(self.limit_query_param, self.offset_query_param,
+                     self.cursor_query_param))
+        user = self.request.user
+        return self.count_cache_key.format(
+            path=self.request.path,
+            viewer=user.id if user.is_authenticated else 'anon',
+            signature=signature,
+            generations='-'.join(str(generations[name]) for name in names))
+
+    def get_estimated_count(self, queryset):
+        """Оценка числа строк таблицы из статистики PostgreSQL."""
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                (queryset.model._meta.db_table,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def get_count(self, queryset):
+        """COUNT(*) кешируется на LIST_COUNT_CACHE_TIMEOUT секунд.
+
+        Для списка без фильтров по большой таблице отдаётся оценка
+        из pg_class.reltuples, в ответе тогда count_is_exact = False.
+        """
+        self.count_is_exact = True
+        key = self.get_count_cache_key()
+        count = cache.get(key) if key else None
+        if count is not None:
+            return count
+        if not queryset.query.has_filters():
+            estimate = self.get_estimated_count(queryset)
+            if (estimate is not None
+                    and estimate > settings.LIST_COUNT_ESTIMATE_THRESHOLD):
+                self.count_is_exact = False
+                return estimate
+        count = super().get_count(queryset)
+        if key:
+            cache.set(key, count, settings.LIST_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_ordering(self, queryset):
+        return (tuple(queryset.query.order_by)
+                or tuple(queryset.model._meta.ordering))
+
+    def get_value(self, obj, field):
+        for attr in field.lstrip('-').split('__'):
+            obj = getattr(obj, attr)
+        return obj
+
+    def get_cursor_filter(self, values):
+        """(a, b) > (va, vb) для сортировки по возрастанию и < для убывания"""
+        cursor_filter = None
+        for field, value in reversed(list(zip(self.ordering, values))):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': value})
+            if cursor_filter is not None:
+                condition |= Q(**{name: value}) & cursor_filter
+            cursor_filter = condition
+        return cursor_filter
+
+    def encode_cursor(self, obj):
+        values = [self.get_value(obj, field) for field in self.ordering]
+        payload = json.dumps(values, default=str).encode()
+        return urlsafe_b64encode(payload).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            response = super().get_paginated_response(data)
+            response.data['count_is_exact'] = self.count_is_exact
+            return response
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
@@ -0,0 +1,109 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+SHOPPING_CART_TITLE = 'Список покупок'
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Ошибки (например, 401 для анонима) отдаются обычным JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            response = (renderer_context or {}).get('response')
+            if response is not None:
+                response['Content-Type'] = JSONRenderer.media_type
+            return JSONRenderer().render(data)
+        return self.render_items(data)
+
+    def render_items(self, items):
+        raise NotImplementedError
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    """Список покупок в виде текстового файла."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render_items(self, items):
+        lines = [f'{SHOPPING_CART_TITLE}\n']
+        for item in items:
+            lines.append(f'{item["ingredient__name"]}: {item["amount"]} '
+                         f'({item["ingredient__measurement_unit"]})\n')
+        return ''.join(lines).encode(self.charset)
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    """Список покупок в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render_items(self, items):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('name', 'amount', 'measurement_unit'))
+        for item in items:
+            writer.writerow((item['ingredient__name'], item['amount'],
+                             item['ingredient__measurement_unit']))
+        return buffer.getvalue().encode(self.charset)
+
+
+class ShoppingCartPDFRenderer(ShoppingCartRenderer):
+    """Список покупок в формате PDF.
+
+    Для кириллицы нужен TTF-шрифт из settings.SHOPPING_CART_PDF_FONT,
+    без него используется встроенный Helvetica.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+    font_name = 'ShoppingCartFont'
+    font_size = 12
+    line_height = 7 * mm
+    margin = 20 * mm
+
+    def get_font_name(self):
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        font_path = getattr(settings, 'SHOPPING_CART_PDF_FONT', None)
+        if not font_path or not os.path.exists(font_path):
+            return 'Helvetica'
+        pdfmetrics.registerFont(TTFont(self.font_name, font_path))
+        return self.font_name
+
+    def render_items(self, items):
+        buffer = io.BytesIO()
+        font_name = self.get_font_name()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        pdf.setTitle(SHOPPING_CART_TITLE)
+        width, height = A4
+        pdf.setFont(font_name, self.font_size + 4)
+        pdf.drawString(self.margin, height - self.margin, SHOPPING_CART_TITLE)
+        pdf.setFont(font_name, self.font_size)
+        y = height - self.margin - 2 * self.line_height
+        for item in items:
+            if y < self.margin:
+                pdf.showPage()
+                pdf.setFont(font_name, self.font_size)
+                y = height - self.margin
+            pdf.drawString(
+                self.margin, y,
+                f'{item["ingredient__name"]}: {item["amount"]} '
+                f'({item["ingredient__measurement_unit"]})')
+            y -= self.line_height
+        pdf.save()
+        return buffer.getvalue()
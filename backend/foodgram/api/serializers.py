@@ -1,16 +1,78 @@
-from drf_extra_fields.fields import Base64ImageField
+from django.conf import settings
+from django.core.cache import cache
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
 from djoser.serializers import (
     UserCreateSerializer as DjoserUserCreateSerializer)
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from rest_framework import serializers
-from rest_framework.generics import get_object_or_404
 
+from .cache import RECIPE_FRAGMENTS, get_generations, recipe_generation_name
+from .fields import StreamingBase64ImageField
+from foodgram.recipe.images import get_variant_urls
 from foodgram.recipe.models import (Favorite, Ingredient, IngredientAmount,
                                     Recipe, ShoppingList, Tag)
 from foodgram.user.models import Subscription, User
 
 
+RECIPE_PREFETCH = (
+    'tags',
+    Prefetch('ingredient_amount',
+             queryset=IngredientAmount.objects.select_related('ingredient')),
+)
+
+
+def get_followed_authors(context):
+    """Id авторов, на которых подписан текущий пользователь.
+
+    Загружается одним запросом и кешируется в контексте сериализатора,
+    который общий для всех вложенных сериализаторов.
+    """
+    followed_authors = context.get('followed_authors')
+    if followed_authors is None:
+        followed_authors = set(Subscription.objects.filter(
+            user=context['request'].user).values_list('author_id', flat=True))
+        context['followed_authors'] = followed_authors
+    return followed_authors
+
+
+def get_recipes_limit(request):
+    try:
+        return int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_author_recipes(author_ids, recipes_limit=None):
+    """Последние рецепты авторов одним запросом: {author_id: [Recipe]}.
+
+    При recipes_limit у каждого автора берутся первые N рецептов через
+    ROW_NUMBER() по author_id, без отдельного запроса на каждого автора.
+    """
+    if not author_ids:
+        # Пустой IN не превращается в SQL для сырого запроса
+        return {}
+    recipes = Recipe.objects.filter(author_id__in=author_ids).only(
+        'id', 'name', 'image', 'cooking_time', 'author_id', 'pub_date')
+    if recipes_limit is not None:
+        ranked = recipes.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        ))
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            'ORDER BY pub_date DESC, id DESC',
+            (*params, recipes_limit))
+    author_recipes = {author_id: [] for author_id in author_ids}
+    for recipe in recipes:
+        author_recipes[recipe.author_id].append(recipe)
+    return author_recipes
+
+
 class UserSerializer(DjoserUserSerializer):
 
     class Meta:
@@ -26,11 +88,10 @@ class SubscribeUserSerializer(DjoserUserSerializer):
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
-        if not request:
+        if (not request or not request.user.is_authenticated
+                or request.user.id == obj.id):
             return False
-        return (request.user.is_authenticated
-                and Subscription.objects.filter(
-                    user=request.user, author=obj).exists())
+        return obj.id in get_followed_authors(self.context)
 
     class Meta:
         fields = ('username', 'first_name', 'last_name',
@@ -106,87 +167,103 @@ class IngredientAmountWriteSerializer(serializers.ModelSerializer):
 class RecipeWriteSerializer(serializers.ModelSerializer):
     ingredients = IngredientAmountWriteSerializer(required=True, many=True)
     author = UserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), required=True,
-        many=True)
-    image = Base64ImageField(required=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=True)
+    image = StreamingBase64ImageField(required=True)
     cooking_time = serializers.IntegerField(
         validators=[MaxValueValidator(5000), MinValueValidator(1)])
 
-    def validate_recipe(self, data):
-        cooking_time = data.get('cooking_time')
-        if cooking_time <= 0:
-            raise serializers.ValidationError(
-                'Время готовки должно быть больше 1'
-            )
-        ingredients_id_list = []
-        ingredients = data.get('ingredients')
-        for ingredient in ingredients:
-            if ingredient.get('amount') <= 0:
-                raise serializers.ValidationError(
-                    'Количество ингридиента должно быть больше 1'
-                )
-            ingredient_id = ingredient['id']
-            if not Ingredient.objects.filter(pk=ingredient_id).exists():
-                raise serializers.ValidationError(
-                    'Ингредиент не существует')
-            ingredients_id_list.append(ingredient['id'])
-        if len(ingredients_id_list) > len(set(ingredients_id_list)):
-            raise serializers.ValidationError(
-                'Указаны повторяющиеся ингридиенты')
-        if not data.get('image'):
-            raise serializers.ValidationError(
-                'Добавьте изображение'
-            )
-        if not data.get('ingredients'):
+    def validate_ingredients(self, ingredients):
+        if not ingredients:
             raise serializers.ValidationError(
-                'В рецепте должны присутствовать ингридиенты'
-            )
-        if not data.get('tags'):
-            raise serializers.ValidationError(
-                'Укажите тег(и)'
-            )
-        tags = data.get('tags')
-        if len(tags) != len(set(tags)):
-            raise serializers.ValidationError(
-                'Теги не должны повторяться'
-            )
-        return data
-
-    def create_ingredients(self, ingredient, recipe):
-        for ingredient_list in ingredient:
-            amount = ingredient_list['amount']
-            ingredient_id = ingredient_list['ingredient']['id']
-            if ingredient_id:
-                ingredient = get_object_or_404(Ingredient, pk=ingredient_id)
-                ingredient_amount = IngredientAmount.objects.create(
-                    recipe=recipe,
-                    ingredient=ingredient,
-                    amount=amount
-                )
-                ingredient_amount.save()
-
+                'В рецепте должны присутствовать ингридиенты')
+        ingredient_ids = [item['ingredient']['id'] for item in ingredients]
+        errors = []
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            errors.append('Указаны повторяющиеся ингридиенты')
+        ingredients_map = Ingredient.objects.in_bulk(ingredient_ids)
+        missing = sorted(set(ingredient_ids) - ingredients_map.keys())
+        if missing:
+            errors.append(f'Ингредиенты не существуют: {missing}')
+        if errors:
+            raise serializers.ValidationError(errors)
+        # Дальше в create/update уходят уже загруженные объекты
+        return [{'ingredient': ingredients_map[item['ingredient']['id']],
+                 'amount': item['amount']} for item in ingredients]
+
+    def validate_tags(self, tag_ids):
+        if not tag_ids:
+            raise serializers.ValidationError('Укажите тег(и)')
+        errors = []
+        if len(tag_ids) != len(set(tag_ids)):
+            errors.append('Теги не должны повторяться')
+        tags_map = Tag.objects.in_bulk(tag_ids)
+        missing = sorted(set(tag_ids) - tags_map.keys())
+        if missing:
+            errors.append(f'Теги не существуют: {missing}')
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [tags_map[tag_id] for tag_id in tag_ids]
+
+    def create_ingredients(self, ingredients, recipe):
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=item['ingredient'],
+                             amount=item['amount'])
+            for item in ingredients)
+
+    def update_ingredients(self, ingredients, recipe):
+        """Применяет к рецепту только изменившиеся ингредиенты."""
+        amounts = {item['ingredient'].id: item['amount']
+                   for item in ingredients}
+        existing = {ingredient_amount.ingredient_id: ingredient_amount
+                    for ingredient_amount in recipe.ingredient_amount.all()}
+        to_delete = [ingredient_amount.id
+                     for ingredient_id, ingredient_amount in existing.items()
+                     if ingredient_id not in amounts]
+        to_update = []
+        for ingredient_id, ingredient_amount in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != ingredient_amount.amount:
+                ingredient_amount.amount = amount
+                to_update.append(ingredient_amount)
+        if to_delete:
+            IngredientAmount.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            IngredientAmount.objects.bulk_update(to_update, ('amount',))
+        self.create_ingredients(
+            [item for item in ingredients
+             if item['ingredient'].id not in existing], recipe)
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                # Хранилище уже перенесло временный файл, закрываем его
+                image.close()
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
-        recipe.save()
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.name = validated_data.get('name', instance.name)
-        instance.image = validated_data.get('image', instance.image)
-        instance.text = validated_data.get('text', instance.text)
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        instance.tags.clear()
-        instance.tags.add(*tags)
-        recipe = instance
-        self.create_ingredients(ingredients, recipe)
-        instance.save()
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Только изменённые поля: полное сохранение затёрло бы счётчики
+        # и image_variants, обновлённые параллельно
+        instance.save(update_fields=(*validated_data, 'updated_at'))
+        instance.tags.set(tags)
+        # Списки покупок сбрасывают сигналы сохранения рецепта
+        self.update_ingredients(ingredients, instance)
         return instance
 
     def to_representation(self, instance):
@@ -204,7 +281,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
 class FavoriteSerializer(serializers.ModelSerializer):
     name = serializers.ReadOnlyField()
-    image = Base64ImageField(read_only=True)
+    image = serializers.ImageField(read_only=True)
 
     class Meta:
         fields = ('id', 'name', 'image',
@@ -256,20 +333,23 @@ class SubscriptionCreateSerializer(serializers.ModelSerializer):
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return Subscription.objects.filter(user=request.user,
-                                               author=obj.author).exists()
+            return obj.author_id in get_followed_authors(self.context)
         return False
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj.author)
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        # Для страницы подписок рецепты загружены заранее во view
+        author_recipes = self.context.get('author_recipes')
+        if author_recipes is not None:
+            recipes = author_recipes.get(obj.author_id, [])
+        else:
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            recipes = Recipe.objects.filter(author=obj.author_id)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return SubscriptionRecipeSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     class Meta:
         fields = ('email', 'username',
@@ -295,18 +375,39 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
 
 
+class RecipeReadListSerializer(serializers.ListSerializer):
+    """Страница рецептов одним обращением к кешу фрагментов."""
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        return self.child.to_representation_many(list(data))
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
+    """Рецепт для чтения.
+
+    Часть ответа, не зависящая от пользователя, кешируется по id рецепта
+    и его поколению; is_favorited, is_in_shopping_cart и
+    author.is_subscribed подставляются при каждом ответе.
+    """
+    fragment_key = 'recipe_fragment:{generation}:{host}:{id}:{version}'
     name = serializers.ReadOnlyField()
     ingredients = IngredientsAmountSerializer(many=True,
                                               source='ingredient_amount')
     author = SubscribeUserSerializer()
     tags = TagSerializer(many=True)
-    image = Base64ImageField()
+    image = serializers.ImageField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
     cooking_time = serializers.IntegerField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     def get_is_favorited(self, obj):
+        # Флаг приходит аннотацией из RecipeViewSet.get_queryset
+        is_favorited = getattr(obj, 'is_favorited', None)
+        if is_favorited is not None:
+            return is_favorited
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Favorite.objects.filter(user=request.user,
@@ -314,18 +415,65 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        is_in_shopping_cart = getattr(obj, 'is_in_shopping_cart', None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return ShoppingList.objects.filter(user=request.user,
                                                recipe=obj).exists()
         return False
 
+    def get_image_variants(self, obj):
+        return get_variant_urls(obj, self.context.get('request'))
+
+    def get_fragment_keys(self, recipes):
+        request = self.context.get('request')
+        host = request.get_host() if request else ''
+        names = {recipe.id: recipe_generation_name(recipe.id)
+                 for recipe in recipes}
+        generations = get_generations([RECIPE_FRAGMENTS, *names.values()])
+        return {
+            recipe.id: self.fragment_key.format(
+                generation=generations[RECIPE_FRAGMENTS], host=host,
+                id=recipe.id, version=generations[names[recipe.id]])
+            for recipe in recipes}
+
+    def to_representation_many(self, recipes):
+        keys = self.get_fragment_keys(recipes)
+        fragments = cache.get_many(keys.values())
+        misses = [recipe for recipe in recipes
+                  if keys[recipe.id] not in fragments]
+        if misses:
+            prefetch_related_objects(misses, *RECIPE_PREFETCH)
+            fresh = {keys[recipe.id]: super(
+                RecipeReadSerializer, self).to_representation(recipe)
+                for recipe in misses}
+            cache.set_many(fresh, settings.RECIPE_FRAGMENT_CACHE_TIMEOUT)
+            fragments.update(fresh)
+        return [self.add_viewer_fields(fragments[keys[recipe.id]], recipe)
+                for recipe in recipes]
+
+    def add_viewer_fields(self, fragment, recipe):
+        data = dict(fragment)
+        data['is_favorited'] = self.get_is_favorited(recipe)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+        data['author'] = dict(
+            data['author'],
+            is_subscribed=self.fields['author'].get_is_subscribed(
+                recipe.author))
+        return data
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
     class Meta:
         fields = ('id', 'name', 'ingredients',
                   'text', 'cooking_time',
                   'is_favorited', 'is_in_shopping_cart', 'tags',
-                  'image', 'author',)
+                  'image', 'image_variants', 'author',)
         model = Recipe
+        list_serializer_class = RecipeReadListSerializer
 
 
 class ShoppingCartRecipeSerializer(serializers.ModelSerializer):
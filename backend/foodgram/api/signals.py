@@ -0,0 +1,243 @@
+import threading
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .cache import (INGREDIENTS, RECIPE_FRAGMENTS, RECIPES, TAGS,
+                    auth_generation_name, bump_generation,
+                    bump_shopping_cart_version, recipe_generation_name,
+                    reset_tag_ids_by_slug, viewer_generation_name)
+from .cookable_index import cookable_index
+from foodgram.recipe.images import schedule_image_processing
+from foodgram.recipe.models import (Favorite, Ingredient, IngredientAmount,
+                                    Recipe, ShoppingList, Tag)
+from foodgram.recipe.search import update_search_vectors
+from foodgram.user.models import Subscription, User
+
+
+# Модель: (модель со счётчиком, поле связи, поле счётчика)
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingList: (Recipe, 'recipe_id', 'shopping_cart_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Subscription: (User, 'author_id', 'followers_count'),
+}
+# Поля автора в ответах с рецептами
+AUTHOR_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+def bump_generation_on_commit(*names):
+    # После коммита, иначе параллельный запрос закеширует старые данные
+    # уже под новым поколением
+    transaction.on_commit(partial(bump_generation, *names))
+
+
+class RecipesOnCommit:
+    """Id рецептов, изменённых в транзакции, для handler после коммита.
+
+    Сигналы приходят на каждую строку, а handler вызывается один раз со
+    всеми id. Колбэк ставится в очередь, только если его там ещё нет:
+    после отката Django очищает очередь, и следующий add() ставит его
+    снова, а оставшиеся от отката id лишь пересчитаются лишний раз.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._local = threading.local()
+
+    def add(self, *recipe_ids):
+        if not hasattr(self._local, 'recipe_ids'):
+            self._local.recipe_ids = set()
+        self._local.recipe_ids.update(recipe_ids)
+        queued = transaction.get_connection().run_on_commit
+        if not any(callback[1] == self.flush for callback in queued):
+            transaction.on_commit(self.flush)
+
+    def flush(self):
+        recipe_ids = getattr(self._local, 'recipe_ids', None)
+        if recipe_ids:
+            self._local.recipe_ids = set()
+            self.handler(recipe_ids)
+
+
+def update_counter(sender, instance, delta):
+    model, relation, field = COUNTERS[sender]
+    # F(): без гонки между параллельными запросами; Greatest: разошедшийся
+    # счётчик не уходит ниже нуля, его поправит reconcile_counters
+    model.objects.filter(pk=getattr(instance, relation)).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def counted_object_created(sender, instance, created, **kwargs):
+    if created:
+        update_counter(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def counted_object_deleted(sender, instance, **kwargs):
+    update_counter(sender, instance, -1)
+
+
+@receiver((post_save, post_delete), sender=ShoppingList)
+def shopping_cart_changed(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(bump_shopping_cart_version, instance.user_id))
+
+
+def bump_shopping_carts(recipes):
+    # Списки покупок всех, у кого эти рецепты в корзине
+    bump_shopping_cart_version(*ShoppingList.objects.filter(
+        recipe__in=recipes).values_list('user_id', flat=True).distinct())
+
+
+# Правка рецепта и строк его ингредиентов меняют списки покупок
+shopping_carts_on_commit = RecipesOnCommit(bump_shopping_carts)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingList)
+@receiver((post_save, post_delete), sender=Subscription)
+def viewer_lists_changed(sender, instance, **kwargs):
+    # Меняет is_favorited, is_in_shopping_cart и is_subscribed в ответах
+    # этому пользователю, а значит и их ETag
+    bump_generation_on_commit(viewer_generation_name(instance.user_id))
+
+
+def update_search_vectors_on_commit(recipes):
+    # После коммита: новый рецепт к этому моменту уже с ингредиентами
+    transaction.on_commit(partial(update_search_vectors, recipes))
+
+
+# Сохранение рецепта и каждая строка его ингредиентов дают один пересчёт
+search_vectors_on_commit = RecipesOnCommit(
+    lambda recipe_ids: update_search_vectors(
+        Recipe.objects.filter(pk__in=recipe_ids)))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_generation_on_commit(INGREDIENTS, RECIPES, RECIPE_FRAGMENTS)
+
+
+def touch(recipes):
+    # Last-Modified рецепта берётся из updated_at, а правки тегов,
+    # ингредиентов и авторов сам рецепт не сохраняют
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    if not created:
+        recipes = Recipe.objects.filter(
+            ingredient_amount__ingredient_id=instance.id)
+        touch(recipes)
+        update_search_vectors_on_commit(recipes)
+        transaction.on_commit(partial(bump_shopping_carts, recipes))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_text_changed(sender, instance, created, **kwargs):
+    search_vectors_on_commit.add(instance.id)
+    # Ингредиенты API меняет через bulk_update и bulk_create без сигналов,
+    # но всегда вместе с сохранением рецепта
+    if not created:
+        shopping_carts_on_commit.add(instance.id)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    reset_tag_ids_by_slug()
+    bump_generation_on_commit(TAGS, RECIPES, RECIPE_FRAGMENTS)
+
+
+@receiver((post_save, pre_delete), sender=Tag)
+def tag_recipes_changed(sender, instance, created=False, **kwargs):
+    # Перед удалением: после него связей тега с рецептами уже нет
+    if not created:
+        touch(Recipe.objects.filter(tags=instance))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    bump_generation_on_commit(RECIPES, recipe_generation_name(instance.id))
+
+
+# refresh() индекса находит только изменённые рецепты, удалённые
+# убираем сами
+deleted_recipes_on_commit = RecipesOnCommit(cookable_index.discard)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    deleted_recipes_on_commit.add(instance.id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    schedule_image_processing(instance)
+
+
+def touch_recipes(recipe_ids):
+    # По updated_at индексы в памяти находят изменённые рецепты, поэтому
+    # поколения меняются только после него
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now())
+    bump_generation(RECIPES, *map(recipe_generation_name, recipe_ids))
+
+
+# Удаление и правка строк ингредиентов дают один UPDATE на транзакцию
+touched_recipes_on_commit = RecipesOnCommit(touch_recipes)
+
+
+@receiver((post_save, post_delete), sender=IngredientAmount)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    touched_recipes_on_commit.add(instance.recipe_id)
+    search_vectors_on_commit.add(instance.recipe_id)
+    shopping_carts_on_commit.add(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if reverse and action == 'pre_clear':
+        # После очистки рецепты тега уже не найти
+        touched_recipes_on_commit.add(
+            *instance.recipe_set.values_list('id', flat=True))
+    elif not reverse and action.startswith('post_'):
+        touched_recipes_on_commit.add(instance.id)
+    elif reverse and action in ('post_add', 'post_remove'):
+        touched_recipes_on_commit.add(*pk_set)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None,
+                   **kwargs):
+    # Вход пользователя обновляет только last_login, а у нового
+    # пользователя ещё нет рецептов и токенов
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    if not update_fields or set(update_fields) & AUTHOR_FIELDS:
+        touch(Recipe.objects.filter(author_id=instance.id))
+    # Смена пароля, деактивация и прочие правки сбрасывают кеш токенов
+    bump_generation_on_commit(RECIPES, RECIPE_FRAGMENTS,
+                              auth_generation_name(instance.id))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # Выход (djoser token/logout) и удаление пользователя удаляют токен
+    bump_generation_on_commit(auth_generation_name(instance.user_id))
@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from .cache import sync_data_versions
+from foodgram.recipe.models import Ingredient, IngredientAmount, Recipe, Tag
+from foodgram.user.models import User
+
+
+@override_settings(DATA_VERSION_CHECK_INTERVAL=60 * 60)
+class RecipeQueryCountTest(APITestCase):
+    """Число запросов к базе не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password')
+        tags = [Tag.objects.create(name=f'Тег {i}', color='#00FF00',
+                                   slug=f'tag{i}') for i in range(3)]
+        ingredients = [Ingredient.objects.create(
+            name=f'Ингредиент {i}', measurement_unit='г') for i in range(6)]
+        for i in range(15):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {i}', author=author, text='Текст',
+                cooking_time=10)
+            recipe.tags.set(tags[:1 + i % 3])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=ingredient,
+                                 amount=100)
+                for ingredient in ingredients[:3 + i % 4])
+        cls.recipe = recipe
+
+    def setUp(self):
+        # Версии данных сверяются раз в интервал, а не в каждом запросе
+        sync_data_versions()
+
+    def count_queries(self, url):
+        # Без кешей ответов и фрагментов, иначе запросов меньше
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant_list_queries(self):
+        counts = [self.count_queries(f'/api/recipes/?limit={limit}')
+                  for limit in (5, 12)]
+        self.assertEqual(counts[0], counts[1])
+        return counts[0]
+
+    def test_list_anonymous(self):
+        # Id тегов по slug, COUNT(*), рецепты с авторами, теги, ингредиенты
+        self.assertEqual(self.assert_constant_list_queries(), 5)
+
+    def test_list_authenticated(self):
+        self.client.force_authenticate(self.user)
+        # Плюс подписки пользователя для is_subscribed
+        self.assertEqual(self.assert_constant_list_queries(), 6)
+
+    def test_detail(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        # Last-Modified, id тегов по slug, рецепт с автором, теги,
+        # ингредиенты
+        self.assertEqual(self.count_queries(url), 5)
+        self.client.force_authenticate(self.user)
+        # Подписки вместо Last-Modified
+        self.assertEqual(self.count_queries(url), 5)
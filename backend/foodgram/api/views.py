@@ -1,31 +1,45 @@
 from django.core.exceptions import PermissionDenied
-from django.db.models import Sum
+from django.db.models import BooleanField, Exists, OuterRef, Sum, Value
 from django.http import HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from .autocomplete import autocomplete_ingredients
+from .cache import (INGREDIENTS, POPULARITY, RECIPE_FRAGMENTS, RECIPES, TAGS,
+                    get_shopping_cart_file, recipe_generation_name,
+                    viewer_generation_name)
+from .cookable_index import cookable_index
 from .filters import IngredientFilter, RecipeFilter
+from .mixins import AnonymousResponseCacheMixin, ConditionalGetMixin
+from .pagination import CursorLimitOffsetPagination
 from .permissions import IsOwnerOrReadOnly
+from .renderers import (ShoppingCartCSVRenderer, ShoppingCartPDFRenderer,
+                        ShoppingCartTextRenderer)
 from .serializers import (FavoriteSerializer, IngredientSerializer,
                           RecipeReadSerializer, RecipeWriteSerializer,
                           ShoppingCartRecipeSerializer,
                           SubscribeUserSerializer,
                           SubscriptionCreateSerializer, TagSerializer,
-                          UserChangePasswordSerializer, UserCreateSerializer)
+                          UserChangePasswordSerializer, UserCreateSerializer,
+                          get_author_recipes, get_recipes_limit)
 from foodgram.recipe.models import (Favorite, Ingredient, IngredientAmount,
                                     Recipe, ShoppingList, Tag)
 from foodgram.user.models import Subscription, User
 
 
+POPULAR = 'popular'
+
+
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.order_by('username', 'id')
     permission_classes = [AllowAny, ]
-    pagination_class = LimitOffsetPagination
+    pagination_class = CursorLimitOffsetPagination
 
     def get_serializer_class(self):
         if self.action == 'list' or self.action == 'retrieve':
@@ -36,7 +50,8 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,))
     def me(self, request):
         """Текущий пользователь"""
-        serializer = SubscribeUserSerializer(request.user)
+        serializer = SubscribeUserSerializer(request.user,
+                                             context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'],
@@ -48,7 +63,9 @@ class UserViewSet(viewsets.ModelViewSet):
                 serializer.validated_data['current_password']):
             request.user.set_password(
                 serializer.validated_data['new_password'])
-            request.user.save()
+            # Только пароль: request.user может быть снимком из кеша
+            # аутентификации со старыми счётчиками
+            request.user.save(update_fields=('password',))
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -56,10 +73,16 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         """Подписки пользователя"""
-        subscriptions = Subscription.objects.filter(user=request.user)
+        subscriptions = Subscription.objects.filter(
+            user=request.user
+        ).select_related('author').order_by('author__username', 'id')
         page_qs = self.paginate_queryset(subscriptions)
-        serializer = SubscriptionCreateSerializer(page_qs, many=True,
-                                                  context={'request': request})
+        author_recipes = get_author_recipes(
+            [subscription.author_id for subscription in page_qs],
+            get_recipes_limit(request))
+        serializer = SubscriptionCreateSerializer(
+            page_qs, many=True, context={'request': request,
+                                         'author_recipes': author_recipes})
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'],
@@ -83,10 +106,16 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousResponseCacheMixin,
+                    viewsets.ModelViewSet):
+    cache_generations = (RECIPES,)
+    etag_generations = (RECIPES,)
+    viewer_dependent = True
     queryset = Recipe.objects.all()
+    # multipart: изображение файлом, не держим весь запрос в памяти
+    parser_classes = (JSONParser, MultiPartParser)
     permission_classes = [IsOwnerOrReadOnly, ]
-    pagination_class = LimitOffsetPagination
+    pagination_class = CursorLimitOffsetPagination
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
 
@@ -95,13 +124,57 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def is_popular_feed(self):
+        return (self.action == 'popular'
+                or self.request.query_params.get('ordering') == POPULAR)
+
     def get_queryset(self):
-        recipes = Recipe.objects.select_related('author').prefetch_related(
-            'tags', 'ingredients')
-        return recipes
+        # Теги и ингредиенты догружает RecipeReadSerializer, и только
+        # для рецептов, которых нет в кеше фрагментов
+        recipes = Recipe.objects.order_by('-pub_date', '-id').select_related(
+            'author').defer('search_vector')
+        if self.is_popular_feed():
+            # Только рецепты из рейтинга: обход индекса по score
+            recipes = recipes.filter(popularity__isnull=False).select_related(
+                'popularity').order_by('-popularity__score', '-id')
+        user = self.request.user
+        if not user.is_authenticated:
+            return recipes.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()))
+        return recipes.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+
+    def get_cache_generations(self):
+        if self.is_popular_feed():
+            return (*self.cache_generations, POPULARITY)
+        return self.cache_generations
+
+    def get_etag_generations(self, request, **kwargs):
+        if self.action != 'retrieve':
+            names = super().get_etag_generations(request, **kwargs)
+            if self.is_popular_feed():
+                names.append(POPULARITY)
+            return names
+        # Рецепт меняется сам или через теги, ингредиенты и автора
+        names = [recipe_generation_name(kwargs['pk']), RECIPE_FRAGMENTS]
+        if request.user.is_authenticated:
+            names.append(viewer_generation_name(request.user.id))
+        return names
+
+    def get_last_modified(self, request, *args, **kwargs):
+        # Только для анонимов: флаги пользователя в updated_at не видны
+        if self.action != 'retrieve' or request.user.is_authenticated:
+            return None
+        return Recipe.objects.filter(pk=kwargs['pk']).values_list(
+            'updated_at', flat=True).first()
 
     def create(self, request):
-        serializer = RecipeWriteSerializer(data=request.data)
+        serializer = RecipeWriteSerializer(
+            data=request.data, context=self.get_serializer_context())
         serializer.is_valid(raise_exception=True)
         serializer.save(author=request.user)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -117,7 +190,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = RecipeWriteSerializer(instance, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        return Response(serializer.data)
+        # Перечитываем рецепт с аннотациями и prefetch, а не по одной строке
+        return Response(RecipeReadSerializer(
+            self.get_object(), context=self.get_serializer_context()).data)
 
     def delete(self, request):
         instance = self.get_object()
@@ -176,33 +251,106 @@ class RecipeViewSet(viewsets.ModelViewSet):
         shopping_list.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['get'])
+    def popular(self, request):
+        """Рецепты по рейтингу популярности, то же что ?ordering=popular"""
+        return self.list(request)
+
+    @action(detail=False, methods=['get'])
+    def cookable(self, request):
+        """Что приготовить из ?ingredients=1,2,3
+
+        Сначала рецепты, для которых есть все ингредиенты, затем по числу
+        недостающих; ?max_missing= ограничивает их число.
+        """
+        try:
+            ingredient_ids = {
+                int(ingredient_id)
+                for value in request.query_params.getlist('ingredients')
+                for ingredient_id in value.split(',') if ingredient_id}
+            max_missing = request.query_params.get('max_missing')
+            if max_missing is not None:
+                max_missing = int(max_missing)
+        except ValueError:
+            msg = {'detail': 'ingredients и max_missing должны быть числами'}
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+        if not ingredient_ids:
+            msg = {'detail': 'Укажите ингредиенты в ?ingredients='}
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+        cookable_index.ensure_fresh()
+        paginator = LimitOffsetPagination()
+        matches = paginator.paginate_queryset(
+            cookable_index.match(ingredient_ids, max_missing), request, self)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in matches])
+        page = []
+        missing = []
+        for recipe_id, missing_count, _ in matches:
+            # Рецепт могли удалить после обновления индекса
+            if recipe_id in recipes:
+                page.append(recipes[recipe_id])
+                missing.append(missing_count)
+        data = RecipeReadSerializer(
+            page, many=True, context=self.get_serializer_context()).data
+        for item, missing_count in zip(data, missing):
+            item['missing_ingredients'] = missing_count
+        return paginator.get_paginated_response(data)
+
     @action(detail=False, methods=['get'],
-            permission_classes=(IsAuthenticated,))
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(ShoppingCartTextRenderer,
+                              ShoppingCartCSVRenderer,
+                              ShoppingCartPDFRenderer))
     def download_shopping_cart(self, request):
-        shopping_cart = ShoppingList.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in shopping_cart]
-        ingredients_amount = IngredientAmount.objects.filter(
-            recipe__in=recipes).values('ingredient').annotate(
-                amount=Sum('amount'))
-        text = 'Список покупок\n'
-        for item in ingredients_amount:
-            ingredient = Ingredient.objects.get(pk=item['ingredient'])
-            amount = item['amount']
-            text += (f'{ingredient.name}: {amount} '
-                     f'({ingredient.measurement_unit})\n')
-        filename = 'shopping_cart.txt'
-        request = HttpResponse(text, content_type='text/plain')
-        request['Content-Disposition'] = f'attachment; filename={filename}'
-        return request
-
-
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+        """Список покупок в формате ?format=txt|csv|pdf"""
+        renderer = request.accepted_renderer
+
+        def render():
+            ingredients = IngredientAmount.objects.filter(
+                recipe__shoppinglist__user=request.user
+            ).values(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).annotate(amount=Sum('amount')).order_by('ingredient__name')
+            return renderer.render_items(ingredients.iterator())
+
+        content = get_shopping_cart_file(request.user.id, renderer.format,
+                                         render)
+        filename = f'shopping_cart.{renderer.format}'
+        response = HttpResponse(content, content_type=renderer.media_type)
+        response['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
+
+
+class TagViewSet(ConditionalGetMixin, AnonymousResponseCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
+    cache_generations = (TAGS,)
+    etag_generations = (TAGS,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, AnonymousResponseCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    cache_generations = (INGREDIENTS,)
+    etag_generations = (INGREDIENTS,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filterset_class = IngredientFilter
     filter_backends = [DjangoFilterBackend, ]
+
+    def list(self, request, *args, **kwargs):
+        """С ?name= работает как автодополнение из кеша в памяти"""
+        if 'name' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.get_conditional_response(self.autocomplete, request)
+
+    def autocomplete(self, request):
+        name = request.query_params['name']
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                msg = {'detail': 'limit должен быть числом'}
+                return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+        return Response(autocomplete_ingredients(name, limit))
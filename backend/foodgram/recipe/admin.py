@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from .models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                     ShoppingList, Tag)
+                     RecipePopularity, ShoppingList, Tag)
 
 
 @admin.register(Ingredient)
@@ -12,13 +12,10 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorites_count',
+                    'shopping_cart_count')
     list_filter = ('name', 'author', 'tags')
 
-    @staticmethod
-    def favorite_count(obj):
-        return obj.favorite.count()
-
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -39,3 +36,8 @@ class FavoriteAdmin(admin.ModelAdmin):
 @admin.register(ShoppingList)
 class ShoppingListAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+
+
+@admin.register(RecipePopularity)
+class RecipePopularityAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'score', 'last_event_at')
@@ -0,0 +1,43 @@
+"""Денормализованные счётчики рецептов и пользователей.
+
+Модели передаются явно, чтобы те же функции работали и в миграциях
+с историческими моделями.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def get_counters(get_model):
+    """(модель, поле счётчика, считаемая модель, её связь с моделью)"""
+    Recipe = get_model('recipe', 'Recipe')
+    User = get_model('user', 'User')
+    return (
+        (Recipe, 'favorites_count', get_model('recipe', 'Favorite'),
+         'recipe'),
+        (Recipe, 'shopping_cart_count', get_model('recipe', 'ShoppingList'),
+         'recipe'),
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'followers_count', get_model('user', 'Subscription'),
+         'author'),
+    )
+
+
+def actual_count(related_model, related_field):
+    return Coalesce(Subquery(
+        related_model.objects.filter(**{related_field: OuterRef('pk')})
+        .order_by().values(related_field)
+        .annotate(count=Count('pk')).values('count')), 0)
+
+
+def reconcile_counter(model, field, related_model, related_field,
+                      batch_size=1000, dry_run=False):
+    """Пересчитывает разошедшиеся счётчики, возвращает их число."""
+    drifted = list(model.objects.annotate(
+        actual=actual_count(related_model, related_field)
+    ).exclude(**{field: F('actual')}).values_list('pk', flat=True))
+    if not dry_run:
+        for start in range(0, len(drifted), batch_size):
+            model.objects.filter(
+                pk__in=drifted[start:start + batch_size]
+            ).update(**{field: actual_count(related_model, related_field)})
+    return len(drifted)
@@ -0,0 +1,158 @@
+"""Уменьшенные копии и WebP-варианты изображений рецептов.
+
+Оригинал сохраняется в запросе как есть, копии делает пул потоков
+процесса уже после коммита. Пока копий нет, в ответе — заглушка.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .media import hashed_name, unhashed_name
+from .models import Recipe
+from foodgram.api.cache import RECIPES, bump_generation, recipe_generation_name
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipe/variants'
+# формат в ответе: (формат Pillow, расширение)
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp'),
+}
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images')
+        return _executor
+
+
+def is_processed(recipe):
+    return recipe.image_variants.get('source') == recipe.image.name
+
+
+def schedule_image_processing(recipe):
+    """Ставит обработку нового изображения в пул после коммита.
+
+    При RECIPE_IMAGE_WORKERS = 0 копии делаются сразу после коммита
+    в том же потоке.
+    """
+    if not recipe.image or is_processed(recipe):
+        return
+    recipe_id, name = recipe.id, recipe.image.name
+    if settings.RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(
+            process_recipe_image, recipe_id, name))
+    else:
+        transaction.on_commit(
+            lambda: process_recipe_image(recipe_id, name))
+
+
+def prepare(image):
+    image = ImageOps.exif_transpose(image)
+    has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def render(image, image_format, name):
+    if image_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format,
+               quality=settings.RECIPE_IMAGE_QUALITY, optimize=True)
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+def make_variants(name):
+    """Сохраняет копии всех размеров и форматов, возвращает их имена."""
+    stem = os.path.splitext(os.path.basename(unhashed_name(name)))[0]
+    sizes = {}
+    with default_storage.open(name) as file, Image.open(file) as source:
+        image = prepare(source)
+    for size_name, size in settings.RECIPE_IMAGE_SIZES.items():
+        variant = image.copy()
+        variant.thumbnail(size, Image.LANCZOS)
+        sizes[size_name] = {}
+        for fmt, (image_format, extension) in VARIANT_FORMATS.items():
+            content = render(variant, image_format,
+                             f'{VARIANTS_DIR}/{stem}_{size_name}.{extension}')
+            name = hashed_name(content.name, content)
+            # То же имя — то же содержимое, повторно не сохраняем
+            if not default_storage.exists(name):
+                name = default_storage.save(name, content)
+            sizes[size_name][fmt] = name
+    return sizes
+
+
+def variant_names(sizes):
+    return {name for formats in sizes.values() for name in formats.values()}
+
+
+def delete_variants(sizes, keep=()):
+    for name in variant_names(sizes) - set(keep):
+        default_storage.delete(name)
+
+
+def process_recipe_image(recipe_id, name):
+    try:
+        sizes = make_variants(name)
+        recipes = Recipe.objects.filter(pk=recipe_id, image=name)
+        old_variants = recipes.values_list(
+            'image_variants', flat=True).first() or {}
+        # Условие по image: рецепт могли удалить или сменить изображение
+        if not recipes.update(
+                image_variants={'source': name, 'sizes': sizes},
+                updated_at=timezone.now()):
+            delete_variants(sizes)
+            return
+        delete_variants(old_variants.get('sizes', {}),
+                        keep=variant_names(sizes))
+        # update() не отправляет сигналы, сбрасываем кеши сами
+        bump_generation(RECIPES, recipe_generation_name(recipe_id))
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s рецепта %s',
+                         name, recipe_id)
+    finally:
+        if settings.RECIPE_IMAGE_WORKERS:
+            # Соединение потока пула иначе остаётся открытым
+            connection.close()
+
+
+def get_variant_urls(recipe, request=None):
+    """URL копий по размерам и форматам, до готовности — заглушка."""
+    if not recipe.image:
+        return None
+
+    def absolute(url):
+        return request.build_absolute_uri(url) if request else url
+
+    if is_processed(recipe):
+        urls = {
+            size_name: {fmt: absolute(default_storage.url(name))
+                        for fmt, name in formats.items()}
+            for size_name, formats in recipe.image_variants['sizes'].items()}
+        return {'ready': True, **urls}
+    placeholder = absolute(settings.RECIPE_IMAGE_PLACEHOLDER
+                           or recipe.image.url)
+    return {
+        'ready': False,
+        **{size_name: dict.fromkeys(VARIANT_FORMATS, placeholder)
+           for size_name in settings.RECIPE_IMAGE_SIZES}}
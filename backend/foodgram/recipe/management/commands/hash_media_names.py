@@ -0,0 +1,172 @@
+import os
+import time
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from foodgram import settings
+from foodgram.api.cache import RECIPE_FRAGMENTS, RECIPES, bump_data_version
+from foodgram.recipe.media import hashed_name, is_hashed
+from foodgram.recipe.models import Recipe
+
+
+# Кеши фрагментов и ответов со старыми URL живут не дольше часа
+OLD_FILES_GRACE = 24 * 60 * 60
+
+
+class Command(BaseCommand):
+    help = ('Переименование изображений рецептов в имена с хешем '
+            'содержимого. Прерванный запуск продолжается с того же места. '
+            'Старые файлы удаляются отдельным запуском с --delete-old')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько рецептов обрабатывать между сохранениями прогресса')
+        parser.add_argument(
+            '--state-file',
+            default=Path(settings.MEDIA_ROOT) / '.hash_media_names',
+            help='Файл с id последнего обработанного рецепта')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с первого рецепта, не читая прогресс')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать файлы без хеша в имени')
+        parser.add_argument(
+            '--old-files',
+            default=Path(settings.MEDIA_ROOT) / '.hash_media_names_old',
+            help='Файл со старыми именами, ожидающими удаления')
+        parser.add_argument(
+            '--delete-old', action='store_true',
+            help='Не переименовывать, а удалить старые файлы, заменённые '
+                 'не меньше --grace секунд назад')
+        parser.add_argument(
+            '--grace', type=int, default=OLD_FILES_GRACE,
+            help='Сколько секунд старые URL могут оставаться в кешах')
+
+    def read_state(self, path):
+        try:
+            return int(Path(path).read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def write_state(self, path, last_id):
+        # Через временный файл, чтобы обрыв не оставил его пустым
+        tmp = f'{path}.tmp'
+        Path(tmp).write_text(str(last_id))
+        os.replace(tmp, path)
+
+    def remember_old(self, path, names):
+        # Удалять сразу нельзя: кеши и клиенты ещё отдают старые URL
+        with open(path, 'a') as file:
+            file.writelines(f'{time.time():.0f}\t{name}\n' for name in names)
+
+    def delete_old(self, path, grace):
+        try:
+            lines = Path(path).read_text().splitlines()
+        except FileNotFoundError:
+            lines = []
+        deadline = time.time() - grace
+        kept = []
+        for line in lines:
+            replaced_at, name = line.split('\t', 1)
+            if float(replaced_at) > deadline:
+                kept.append(line)
+            else:
+                default_storage.delete(name)
+        if kept:
+            tmp = f'{path}.tmp'
+            Path(tmp).write_text(''.join(f'{line}\n' for line in kept))
+            os.replace(tmp, path)
+        elif os.path.exists(path):
+            os.remove(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено старых файлов: {len(lines) - len(kept)}, '
+            f'ещё ждут удаления: {len(kept)}'))
+
+    def file_names(self, recipe):
+        names = [recipe.image.name]
+        if recipe.image_variants.get('source') == recipe.image.name:
+            for formats in recipe.image_variants['sizes'].values():
+                names.extend(formats.values())
+        return names
+
+    def copy_hashed(self, name):
+        """Копирует файл под имя с хешем, исходный файл не трогает."""
+        with default_storage.open(name) as file:
+            new_name = hashed_name(name, file)
+            if default_storage.exists(new_name):
+                with default_storage.open(new_name) as existing:
+                    if new_name == hashed_name(name, existing):
+                        return new_name
+                # Недописанная копия из прерванного запуска
+                default_storage.delete(new_name)
+            return default_storage.save(new_name, file)
+
+    def rename_recipe(self, recipe):
+        """Возвращает имена старых файлов или None, если менять нечего."""
+        image = recipe.image.name
+        variants = recipe.image_variants
+        renamed = {name: self.copy_hashed(name)
+                   for name in self.file_names(recipe) if not is_hashed(name)}
+        if variants.get('source') == image:
+            variants = {
+                'source': renamed.get(image, image),
+                'sizes': {
+                    size_name: {fmt: renamed.get(name, name)
+                                for fmt, name in formats.items()}
+                    for size_name, formats in variants['sizes'].items()}}
+        if not renamed:
+            return None
+        # Условие по image: рецепт могли изменить, пока копировали файлы
+        updated = Recipe.objects.filter(pk=recipe.id, image=image).update(
+            image=renamed.get(image, image), image_variants=variants,
+            updated_at=timezone.now())
+        return list(renamed) if updated else []
+
+    def handle(self, *args, **options):
+        if options['delete_old']:
+            return self.delete_old(options['old_files'], options['grace'])
+        started = time.monotonic()
+        state_file = options['state_file']
+        last_id = 0 if options['restart'] else self.read_state(state_file)
+        if last_id:
+            self.stdout.write(f'Продолжение после рецепта {last_id}')
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True).order_by('id').only(
+            'id', 'image', 'image_variants')
+        renamed = skipped = 0
+        while True:
+            batch = list(recipes.filter(id__gt=last_id)[
+                :options['batch_size']])
+            if not batch:
+                break
+            for recipe in batch:
+                if options['dry_run']:
+                    renamed += not all(
+                        map(is_hashed, self.file_names(recipe)))
+                    continue
+                old_names = self.rename_recipe(recipe)
+                if old_names is None:
+                    continue
+                if not old_names:
+                    skipped += 1
+                    continue
+                self.remember_old(options['old_files'], old_names)
+                renamed += 1
+            last_id = batch[-1].id
+            if not options['dry_run']:
+                # update() не отправляет сигналы, сбрасываем кеши сами,
+                # в том числе веб-процесса
+                bump_data_version(RECIPES, RECIPE_FRAGMENTS)
+                self.write_state(state_file, last_id)
+        if not options['dry_run'] and os.path.exists(state_file):
+            os.remove(state_file)
+        elapsed = time.monotonic() - started
+        action = 'Будет переименовано' if options['dry_run'] else (
+            'Переименовано')
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {renamed} рецептов, изменились во время работы: '
+            f'{skipped}, за {elapsed:.2f} с'))
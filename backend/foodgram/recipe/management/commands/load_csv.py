@@ -1,31 +1,108 @@
 import csv
-import traceback
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from foodgram import settings
+from foodgram.api.cache import INGREDIENTS, bump_data_version
 from foodgram.recipe.models import Ingredient
 
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for name, measurement_unit in csv.reader(file):
+        yield name, measurement_unit
+
+
+def read_json(file):
+    """Читает массив объектов из JSON по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидался JSON-массив')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        yield obj['name'], obj['measurement_unit']
+        buffer = buffer[end:]
+
 
 class Command(BaseCommand):
+    help = 'Загрузка ингредиентов из CSV или JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file_name', nargs='?',
+            default=settings.BASE_DIR / 'data' / 'ingredients.csv',
+            help='Путь к ingredients.csv или ingredients.json')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять за один запрос')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Прочитать файл и посчитать новые строки без записи в базу')
+
+    def read_rows(self, file, file_name):
+        reader = read_json if Path(file_name).suffix == '.json' else read_csv
+        seen = set()
+        for name, measurement_unit in reader(file):
+            row = (name.strip(), measurement_unit.strip())
+            if row[0] and row not in seen:
+                seen.add(row)
+                yield row
 
     def handle(self, *args, **options):
-        file_name = settings.BASE_DIR / 'data' / 'ingredients.csv'
+        file_name = options['file_name']
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        started = time.monotonic()
+        total_before = Ingredient.objects.count()
+        existing = set()
+        if dry_run:
+            existing = set(Ingredient.objects.values_list(
+                'name', 'measurement_unit'))
+        unique = new = 0
         try:
-            with open(file_name) as file:
-                self.stdout.write(f"Чтение файла {file_name}\n")
-                reader = csv.DictReader(
-                    file, fieldnames=['name', 'measurement_unit'])
-                for row in reader:
-                    obj, created = Ingredient.objects.get_or_create(
-                        name=row['name'],
-                        measurement_unit=row['measurement_unit'])
-                    if not created:
-                        self.stdout.write(
-                            f"Объект {obj.measurement_unit} "
-                            f"{obj.name} уже создан\n")
-                    obj.save()
-        except Exception:
+            with open(file_name, encoding='utf-8') as file, \
+                    transaction.atomic():
+                self.stdout.write(f'Чтение файла {file_name}')
+                rows = self.read_rows(file, file_name)
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    unique += len(batch)
+                    if dry_run:
+                        new += sum(row not in existing for row in batch)
+                        continue
+                    Ingredient.objects.bulk_create(
+                        (Ingredient(name=name, measurement_unit=unit)
+                         for name, unit in batch),
+                        ignore_conflicts=True)
+        except Exception as error:
             raise CommandError(
-                f"При чтении файла {file_name} "
-                f"произошла ошибка: {traceback.format_exc()}"
-            )
+                f'При чтении файла {file_name} произошла ошибка: {error}')
+        if not dry_run:
+            new = Ingredient.objects.count() - total_before
+            # bulk_create не отправляет сигналы, сбрасываем кеши сами,
+            # в том числе уже запущенного веб-процесса
+            bump_data_version(INGREDIENTS)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет добавлено" if dry_run else "Добавлено"} {new} '
+            f'из {unique} уникальных строк за {elapsed:.2f} с '
+            f'({unique / elapsed if elapsed else unique:.0f} строк/с)'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from foodgram.api.cache import RECIPE_FRAGMENTS, RECIPES, bump_data_version
+from foodgram.recipe.images import is_processed, process_recipe_image
+from foodgram.recipe.models import Recipe
+
+# Через сколько рецептов показывать готовые копии веб-процессу
+BUMP_EVERY = 100
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий и WebP-вариантов изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии и для уже обработанных рецептов')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True).only('id', 'image', 'image_variants')
+        processed = 0
+        for recipe in recipes.iterator():
+            if not options['all'] and is_processed(recipe):
+                continue
+            process_recipe_image(recipe.id, recipe.image.name)
+            processed += 1
+            if processed % BUMP_EVERY == 0:
+                bump_data_version(RECIPES, RECIPE_FRAGMENTS)
+        # process_recipe_image сбрасывает поколения только в этом процессе
+        if processed % BUMP_EVERY:
+            bump_data_version(RECIPES, RECIPE_FRAGMENTS)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {processed} изображений за {elapsed:.2f} с'))
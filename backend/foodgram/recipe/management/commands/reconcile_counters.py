@@ -0,0 +1,31 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from foodgram.recipe.counters import get_counters, reconcile_counter
+
+
+class Command(BaseCommand):
+    help = 'Сверка счётчиков избранного, корзин, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк обновлять за один запрос')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать разошедшиеся счётчики')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        for model, field, *counter in get_counters(apps.get_model):
+            drifted = reconcile_counter(
+                model, field, *counter, batch_size=options['batch_size'],
+                dry_run=options['dry_run'])
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: '
+                f'{"разошлось" if options["dry_run"] else "исправлено"} '
+                f'{drifted}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Сверка заняла {elapsed:.2f} с'))
@@ -0,0 +1,41 @@
+"""Имена медиафайлов с хешем содержимого: recipe/<имя>.<хеш>.<расширение>
+
+Файл под таким именем никогда не меняется, поэтому nginx отдаёт его
+с Cache-Control: immutable (см. infra/nginx.conf).
+"""
+import hashlib
+import os
+import re
+
+HASH_LENGTH = 12
+# Хранилище при совпадении имён добавляет _<7 символов>, имя остаётся
+# уникальным для содержимого
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{%d}(_[A-Za-z0-9]{7})?$' % HASH_LENGTH)
+
+
+def content_hash(file):
+    hasher = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()[:HASH_LENGTH]
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME_RE.search(os.path.splitext(name)[0]))
+
+
+def unhashed_name(name):
+    root, ext = os.path.splitext(name)
+    return HASHED_NAME_RE.sub('', root) + ext
+
+
+def hashed_name(name, file):
+    root, ext = os.path.splitext(unhashed_name(name))
+    return f'{root}.{content_hash(file)}{ext.lower()}'
+
+
+def recipe_image_path(instance, filename):
+    # instance.image ещё не сохранён и держит загруженное содержимое
+    return hashed_name(f'recipe/{filename}', instance.image.file)
@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Склеивает дубли перед добавлением уникального ограничения."""
+    Ingredient = apps.get_model('recipe', 'Ingredient')
+    IngredientAmount = apps.get_model('recipe', 'IngredientAmount')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        extra_ids = list(Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=duplicate['keep_id']).values_list('id', flat=True))
+        IngredientAmount.objects.filter(ingredient_id__in=extra_ids).update(
+            ingredient_id=duplicate['keep_id'])
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0004_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 10:41
+
+from django.db import migrations, models
+import foodgram.recipe.media
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0009_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to=foodgram.recipe.media.recipe_image_path),
+        ),
+    ]
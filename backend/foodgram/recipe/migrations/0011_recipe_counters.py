@@ -0,0 +1,33 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+from foodgram.recipe.counters import get_counters, reconcile_counter
+
+
+def fill_recipe_counters(apps, schema_editor):
+    for model, *counter in get_counters(apps.get_model):
+        if model._meta.model_name == 'recipe':
+            reconcile_counter(model, *counter)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0010_recipe_image_hashed_name'),
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_recipe_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.16 on 2026-10-18 13:50
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+INDEX_NAME = 'recipe_search_vector_idx'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipe_recipe '
+        'USING gin (search_vector)')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+def fill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Те же веса, что в recipe.search, но на исторических моделях
+    schema_editor.execute(
+        'UPDATE recipe_recipe SET search_vector = '
+        "setweight(to_tsvector(%(config)s, coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector(%(config)s, coalesce(text, '')), 'B') || "
+        'setweight(to_tsvector(%(config)s, coalesce(('
+        "SELECT string_agg(i.name, ' ') FROM recipe_ingredientamount a "
+        'JOIN recipe_ingredient i ON i.id = a.ingredient_id '
+        "WHERE a.recipe_id = recipe_recipe.id), '')), 'C')",
+        {'config': settings.SEARCH_CONFIG})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0012_recipe_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
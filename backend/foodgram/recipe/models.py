@@ -1,6 +1,9 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+
+from .media import recipe_image_path
 from foodgram.user.models import User
 
 
@@ -12,6 +15,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -59,18 +68,33 @@ class Recipe(models.Model):
                                related_name='recipes',)
     tags = models.ManyToManyField(Tag)
     image = models.ImageField(
-        upload_to='recipe/', null=True, blank=True)
+        upload_to=recipe_image_path, null=True, blank=True)
+    # {'source': имя оригинала, 'sizes': {размер: {формат: имя файла}}}
+    image_variants = models.JSONField(default=dict, blank=True,
+                                      editable=False)
     text = models.TextField()
     cooking_time = models.PositiveSmallIntegerField(
         validators=[MinValueValidator(1)],
         error_messages={
             "min_value": "Время готовки не может быть указано меньше минуты"})
     pub_date = models.DateTimeField(auto_now_add=True)
+    # Индекс: по нему индексы в памяти находят изменённые рецепты
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Счётчики обновляют сигналы api.signals, сверяет reconcile_counters
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    shopping_cart_count = models.PositiveIntegerField(default=0,
+                                                      editable=False)
+    # Заполняется сигналами через recipe.search, индекс только в PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+        )
 
     def __str__(self):
         return self.name
@@ -83,6 +107,8 @@ class BaseUserListModel(models.Model):
     recipe = models.ForeignKey(Recipe,
                                on_delete=models.CASCADE,
                                related_name='%(class)s')
+    # По нему update_popularity выбирает новые события
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         abstract = True
@@ -115,3 +141,49 @@ class ShoppingList(BaseUserListModel):
             models.UniqueConstraint(
                 fields=('user', 'recipe'),
                 name='unique_shopping_cart',),)
+
+
+class RecipePopularity(models.Model):
+    """Рейтинг популярности, пересчитывается командой update_popularity.
+
+    score — логарифм суммы весов добавлений в избранное и корзину,
+    каждый вес умножен на 2 ** ((время события - EPOCH) / период
+    полураспада). Старые события так теряют вес относительно новых,
+    а уже посчитанные строки не нужно пересчитывать.
+    """
+    recipe = models.OneToOneField(Recipe,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='popularity')
+    score = models.FloatField()
+    last_event_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = (
+            models.Index(fields=('-score', '-recipe'),
+                         name='recipe_popularity_score_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe_id} {self.score:.3f}'
+
+
+class DataVersion(models.Model):
+    """Версии данных, которые меняют management-команды.
+
+    Команда работает в своём процессе, и при кеше в памяти её
+    bump_generation веб-процесс не видит. Поэтому она ещё и увеличивает
+    версию здесь, а веб-процесс периодически сверяет версии и сбрасывает
+    поколения с тем же именем (api.cache.sync_data_versions).
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name} {self.version}'
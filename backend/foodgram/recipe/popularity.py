@@ -0,0 +1,80 @@
+"""Рейтинг популярности с затуханием по времени.
+
+Вклад события — log(вес) + ln 2 * (время - EPOCH) / период полураспада,
+рейтинг рецепта — логарифм суммы экспонент вкладов. Множитель, общий
+для всех рецептов, порядок не меняет, поэтому посчитанные строки не
+пересчитываются: вклады новых событий просто добавляются к сумме, а
+логарифм не даёт ей переполниться.
+"""
+import math
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from django.conf import settings
+
+from .models import Favorite, RecipePopularity, ShoppingList
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+EVENT_MODELS = {
+    'favorite': Favorite,
+    'shopping_cart': ShoppingList,
+}
+
+
+def event_score(weight, created_at):
+    half_life = timedelta(
+        days=settings.POPULAR_HALF_LIFE_DAYS).total_seconds()
+    return (math.log(weight)
+            + math.log(2) * (created_at - EPOCH).total_seconds() / half_life)
+
+
+def add_scores(first, second):
+    """log(exp(first) + exp(second)) без переполнения"""
+    if first is None:
+        return second
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def collect_scores(since, until):
+    """Вклады событий из (since, until] по рецептам."""
+    scores = {}
+    for name, model in EVENT_MODELS.items():
+        weight = settings.POPULAR_WEIGHTS[name]
+        if weight <= 0:
+            continue
+        events = model.objects.filter(created_at__lte=until)
+        if since is not None:
+            events = events.filter(created_at__gt=since)
+        for recipe_id, created_at in events.values_list(
+                'recipe_id', 'created_at').order_by().iterator():
+            score, last_event_at = scores.get(recipe_id, (None, created_at))
+            scores[recipe_id] = (add_scores(score,
+                                            event_score(weight, created_at)),
+                                 max(last_event_at, created_at))
+    return scores
+
+
+def apply_scores(scores, batch_size):
+    """Добавляет вклады к таблице RecipePopularity пачками."""
+    recipe_ids = iter(scores)
+    while True:
+        batch = list(islice(recipe_ids, batch_size))
+        if not batch:
+            return
+        existing = RecipePopularity.objects.in_bulk(batch)
+        updated, created = [], []
+        for recipe_id in batch:
+            score, last_event_at = scores[recipe_id]
+            row = existing.get(recipe_id)
+            if row is None:
+                created.append(RecipePopularity(
+                    recipe_id=recipe_id, score=score,
+                    last_event_at=last_event_at))
+                continue
+            row.score = add_scores(row.score, score)
+            row.last_event_at = max(row.last_event_at, last_event_at)
+            updated.append(row)
+        RecipePopularity.objects.bulk_update(
+            updated, ('score', 'last_event_at'))
+        RecipePopularity.objects.bulk_create(created)
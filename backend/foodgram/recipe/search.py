@@ -0,0 +1,61 @@
+"""Полнотекстовый поиск рецептов.
+
+В PostgreSQL — по колонке search_vector с GIN-индексом: название с весом
+A, описание — B, названия ингредиентов — C. На других базах (SQLite при
+локальной разработке) — LIKE по тем же полям.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import (Case, Exists, F, Func, IntegerField, OuterRef,
+                              Q, Subquery, TextField, Value, When)
+from django.db.models.functions import Coalesce
+
+from .models import IngredientAmount, Recipe
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def get_search_vector():
+    config = settings.SEARCH_CONFIG
+    ingredient_names = IngredientAmount.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(names=Func(
+        F('ingredient__name'), Value(' '), function='string_agg',
+        output_field=TextField())).values('names')
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector('text', weight='B', config=config)
+        + SearchVector(Coalesce(Subquery(ingredient_names), Value(''),
+                                output_field=TextField()),
+                       weight='C', config=config))
+
+
+def update_search_vectors(recipes=None):
+    """Пересчитывает search_vector одним UPDATE, по умолчанию для всех."""
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    if is_postgresql(recipes):
+        recipes.update(search_vector=get_search_vector())
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под text, от самых релевантных."""
+    if is_postgresql(queryset):
+        query = SearchQuery(text, config=settings.SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+    in_ingredients = Exists(IngredientAmount.objects.filter(
+        recipe=OuterRef('pk'), ingredient__name__icontains=text))
+    return queryset.filter(
+        Q(name__icontains=text) | Q(text__icontains=text) | in_ingredients
+    ).annotate(rank=Case(
+        When(name__icontains=text, then=Value(3)),
+        When(text__icontains=text, then=Value(2)),
+        default=Value(1), output_field=IntegerField(),
+    )).order_by('-rank', '-id')
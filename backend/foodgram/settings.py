@@ -9,7 +9,7 @@ https://docs.djangoproject.com/en/3.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
-# import os
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -101,6 +101,25 @@ DATABASES = {
 
 print("******", DATABASES)
 
+# Cache
+# Для общего кеша между воркерами укажите, например,
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# CACHE_LOCATION=/var/tmp/foodgram_cache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND',
+                             'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Как часто сверять версии данных, которые меняют management-команды
+# (api.cache.sync_data_versions)
+DATA_VERSION_CHECK_INTERVAL = 5
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -155,13 +174,64 @@ REST_FRAMEWORK = {
     #     'rest_framework.permissions.IsAuthenticated',
     # ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'foodgram.api.authentication.CachedTokenAuthentication',
     ],
     # 'DEFAULT_PAGINATION_CLASS':
     # 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 10,
 }
 
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60
+SHOPPING_CART_PDF_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+INGREDIENTS_AUTOCOMPLETE_LIMIT = 20
+INGREDIENTS_AUTOCOMPLETE_MAX_LIMIT = 100
+INGREDIENTS_AUTOCOMPLETE_CACHE_SIZE = 1024
+INGREDIENTS_INDEX_ENABLED = True
+INGREDIENTS_INDEX_PRELOAD = True
+INGREDIENTS_INDEX_CHECK_INTERVAL = 60
+
+# Кеш пользователей по токену, см. api.authentication
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60
+AUTH_TOKEN_SHARED_CACHE = os.getenv(
+    'AUTH_TOKEN_SHARED_CACHE', 'False').lower() == 'true'
+
+# Словарь PostgreSQL для полнотекстового поиска рецептов
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+
+# Рейтинг популярности, см. recipe.popularity
+POPULAR_HALF_LIFE_DAYS = 7
+POPULAR_WEIGHTS = {
+    'favorite': 1.0,
+    'shopping_cart': 2.0,
+}
+
+LIST_COUNT_CACHE_TIMEOUT = 30
+LIST_COUNT_ESTIMATE_THRESHOLD = 10000
+
+# Уменьшенные копии изображений рецептов, (ширина, высота) — границы
+RECIPE_IMAGE_SIZES = {
+    'list': (320, 320),
+    'card': (640, 640),
+    'detail': (1280, 1280),
+}
+RECIPE_IMAGE_QUALITY = 82
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+# Пока копии не готовы, отдаётся этот URL или, если не задан, оригинал
+RECIPE_IMAGE_PLACEHOLDER = os.getenv('RECIPE_IMAGE_PLACEHOLDER')
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+# формат Pillow: расширение файла
+RECIPE_IMAGE_FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+    'GIF': 'gif',
+}
+# JSON с изображением в base64 длиннее файла на треть
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_SIZE * 4 // 3 + 1024 * 1024
+
 DJOSER = {
     'SERIALIZERS': {
         'user_create': 'api.serializers.UserCreateSerializer',
@@ -5,7 +5,8 @@ from .models import Subscription, User
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'first_name', 'last_name', 'password')
+    list_display = ('username', 'email', 'first_name', 'last_name', 'password',
+                    'recipes_count', 'followers_count')
     list_filter = ('username',)
     search_fields = ('username', 'email')
 
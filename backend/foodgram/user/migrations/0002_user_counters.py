@@ -0,0 +1,33 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+from foodgram.recipe.counters import get_counters, reconcile_counter
+
+
+def fill_user_counters(apps, schema_editor):
+    for model, *counter in get_counters(apps.get_model):
+        if model._meta.model_name == 'user':
+            reconcile_counter(model, *counter)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0001_initial'),
+        ('recipe', '0011_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_user_counters, migrations.RunPython.noop),
+    ]
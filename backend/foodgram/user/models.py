@@ -8,6 +8,9 @@ class User(AbstractUser):
     first_name = models.CharField(max_length=150, blank=True)
     last_name = models.CharField(max_length=254, blank=True)
     password = models.CharField(max_length=150, unique=True)
+    # Счётчики обновляют сигналы api.signals, сверяет reconcile_counters
+    recipes_count = models.PositiveIntegerField(default=0, editable=False)
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
@@ -14,3 +14,15 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.INGREDIENTS_INDEX_ENABLED and settings.INGREDIENTS_INDEX_PRELOAD:
+    # Индекс ингредиентов строится один раз при старте воркера
+    from django.db import DatabaseError  # noqa: E402
+    from foodgram.api.ingredient_index import ingredient_index  # noqa: E402
+
+    try:
+        ingredient_index.ensure_fresh()
+    except DatabaseError:
+        pass